@@ -1,9 +1,8 @@
 import argparse
+import importlib
 import sys
 
 from yacce import common
-from yacce.mod_bazel import mode_bazel
-from yacce.mod_from_log import mode_from_log
 
 
 def _getModeHelpString(mode: str) -> str:
@@ -24,7 +23,11 @@ kModes = {
     "log file and turns it into compile_commands.json as is.\n" + _getModeHelpString("from_log"),
 }
 
-kModeFuncs = {"bazel": mode_bazel, "from_log": mode_from_log}
+# modules are imported only when a mode is actually run, which keeps `yacce --help` fast
+kModeFuncs = {
+    "bazel": ("yacce.mod_bazel", "mode_bazel"),
+    "from_log": ("yacce.mod_from_log", "mode_from_log"),
+}
 
 
 def getModeArgs():
@@ -65,14 +68,17 @@ def getModeArgs():
         default=True,
     )
 
-    modes = parser.add_subparsers(
-        help='Modes of operation. Use "--help" with each mode to get more information.'
+    # a mode is just a choice of a single positional argument, there's no need for subparsers, since
+    # everything past the mode is parsed by the mode itself
+    parser.add_argument(
+        "mode",
+        help='Mode of operation. Use "--help" with each mode to get more information.\n'
+        + "\n".join(f"- {mode}: {description}" for mode, description in kModes.items()),
+        nargs="?",
+        choices=kModes.keys(),
+        default=None,
     )
 
-    for mode, description in kModes.items():
-        p = modes.add_parser(mode, help=description)
-        p.add_argument("--mode", dest="mode", default=mode, help=argparse.SUPPRESS)
-
     if len(sys.argv) <= 2:  # there's always more than 1 arg
         parser.print_help()
         sys.exit(2)
@@ -100,12 +106,15 @@ def main():
     Con.debug("mode args:", args)
     Con.debug("args past the mode:", unparsed_args)
 
-    if not hasattr(args, "mode"):
+    if args.mode is None:
         Con.debug("Mode is not specified, using the default")
-    mode = getattr(args, "mode", next(iter(kModes)))
+        args.mode = next(iter(kModes))
+    mode = args.mode
 
     try:
-        ret = kModeFuncs[mode](Con, args, unparsed_args)
+        module_name, func_name = kModeFuncs[mode]
+        mode_func = getattr(importlib.import_module(module_name), func_name)
+        ret = mode_func(Con, args, unparsed_args)
         common.warnClangdIncompatibilitiesIfAny(Con, args)
 
         Con.debug(f"Exiting with code {ret}")
@@ -114,6 +123,9 @@ def main():
         Con.critical(repr(e))
         Con.debug("Exiting with code 1")
         sys.exit(1)
+    finally:
+        # buffered records must be shown before a traceback of an unexpected exception, if any
+        Con.flush()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,31 @@
 """Commonly needed data & code"""
 
 import argparse
-from collections import namedtuple
+import array
+import atexit
+from collections import deque
+from collections.abc import Iterable, Iterator
+import concurrent.futures
+from dataclasses import dataclass
 import enum
+import functools
+import itertools
+import json
+import mmap
+import multiprocessing
 import os
+import queue
 import re
-import rich.console
-import rich.progress
+import sys
+import threading
+from typing import NamedTuple
 # import textwrap
 
+try:
+    import orjson  # optional, just a faster JSON encoder
+except ImportError:
+    orjson = None
+
 
 class YacceException(RuntimeError):
     def __init__(self, *args: object) -> None:
@@ -16,7 +33,9 @@ class YacceException(RuntimeError):
 
 
 # adapted from https://github.com/Arech/benchstats/blob/be9e925ae85b7dc1c19044ad5f6eddea681f9f77/src/benchstats/common.py#L56
-class LoggingConsole(rich.console.Console):
+# Wraps rich's Console instead of inheriting from it to import rich only when a console is created,
+# since rich is a heavy import that isn't needed to e.g. print CLI help.
+class LoggingConsole:
     # @enum.verify(enum.CONTINUOUS)  # not supported by Py 3.10
     class LogLevel(enum.IntEnum):
         Trace = 0
@@ -27,15 +46,50 @@ class LoggingConsole(rich.console.Console):
         Failure = 5  # non-recoverable, can continue working
         Critical = 6  # non-recoverable, must abort
 
+    # max number of log records to keep in the buffer before handing them over to the writer thread
+    kBufferLimit = 256
+    # max number of buffers waiting for the writer thread before a logging call blocks
+    kMaxPendingBuffers = 16
+    # types of log arguments that are safe to render later
+    _kBufferable = (str, int, float, type(None))
+
     def __init__(self, log_level: LogLevel = LogLevel.Trace, **kwargs):
         assert isinstance(log_level, LoggingConsole.LogLevel)
         self.log_level = log_level
+        # logging methods that are below the log level are replaced with a no-op, so a disabled
+        # logging call doesn't pay even for the level check. Hence log_level must not change later
+        for name, level in (
+            ("trace", LoggingConsole.LogLevel.Trace),
+            ("debug", LoggingConsole.LogLevel.Debug),
+            ("info", LoggingConsole.LogLevel.Info),
+            ("warning", LoggingConsole.LogLevel.Warning),
+        ):
+            if log_level > level:
+                setattr(self, name, LoggingConsole._noLog)
+        # error logging methods must count errors anyway, so they test precomputed flags instead
+        self._log_error = log_level <= LoggingConsole.LogLevel.Error
+        self._log_failure = log_level <= LoggingConsole.LogLevel.Failure
+        self._log_critical = log_level <= LoggingConsole.LogLevel.Critical
         self._n_errors: int = 0
+        # log records (args, kwargs) that aren't rendered yet. Rendering each record individually is
+        # very slow, so records are accumulated and passed in batches to a background writer thread,
+        # which keeps the rendering and the terminal I/O off the caller's thread.
+        self._buf: list[tuple[tuple, dict]] = []
+        self._queue: queue.Queue[list[tuple[tuple, dict]]] = queue.Queue(self.kMaxPendingBuffers)
         if "emoji" not in kwargs:
             kwargs["emoji"] = False
         if "highlight" not in kwargs:
             kwargs["highlight"] = False
-        super().__init__(**kwargs)
+        import rich.console
+
+        self.console = rich.console.Console(**kwargs)
+        # the first exception raised while rendering records. It's re-raised on the caller's thread
+        self._writer_exc: Exception | None = None
+        self._writer = threading.Thread(
+            target=self._writerLoop, name="yacce_log_writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.flush)
 
     def cleanNumErrors(self) -> int:
         r = self._n_errors
@@ -45,60 +99,131 @@ class LoggingConsole(rich.console.Console):
     def getNumErrors(self) -> int:
         return self._n_errors
 
-    def _do_log(self, color: str, lvl: str, *args, **kwargs):
-        if "sep" in kwargs:
-            sep = kwargs["sep"] if len(kwargs["sep"]) > 0 else " "
+    # prefixes of log records, each ending with the default separator
+    _kTracePfx = "[[blue]trce[/blue]] "
+    _kDebugPfx = "[[bright_black]dbg [/bright_black]] "
+    _kInfoPfx = "[[bright_white]info[/bright_white]] "
+    _kWarningPfx = "[[yellow]warn[/yellow]] "
+    _kErrorPfx = "[[red]Err [/red]] "
+    _kFailurePfx = "[[bright_red]FAIL[/bright_red]] "
+    _kCriticalPfx = "[[bright_magenta]CRIT[/bright_magenta]] "
+
+    def _do_log(self, prefix: str, *args, **kwargs):
+        sep = kwargs.setdefault("sep", " ")
+        if sep and sep != " ":
+            prefix = prefix[:-1] + sep
+        args = (prefix, *args)
+        if all(isinstance(a, LoggingConsole._kBufferable) for a in args):
+            self._buf.append((args, kwargs))
+            if len(self._buf) >= self.kBufferLimit:
+                self._submitBuffer()
+        else:  # a mutable object might change before rendering, so printing it right away
+            self.print(*args, **kwargs)
+
+    def _submitBuffer(self) -> None:
+        if self._buf:
+            buf, self._buf = self._buf, []
+            if self._writer.is_alive():
+                self._queue.put(buf)
+            else:  # never hand records over to a dead writer
+                self._renderBuffer(buf)
+
+    def _renderBuffer(self, buf: list[tuple[tuple, dict]]) -> None:
+        try:
+            # rich's Console context accumulates the output and writes it once on exit
+            with self.console:
+                for args, kwargs in buf:
+                    # a bad record, such as with a markup error due to a path, must not stop others
+                    try:
+                        self.console.print(*args, **kwargs)
+                    except Exception as e:  # noqa: BLE001 - re-raised by flush()
+                        if self._writer_exc is None:
+                            self._writer_exc = e
+        except Exception as e:  # noqa: BLE001 - re-raised by flush()
+            if self._writer_exc is None:
+                self._writer_exc = e
+
+    def _writerLoop(self) -> None:
+        # the writer must never die, otherwise flush() would wait for it forever
+        while True:
+            buf = self._queue.get()
+            try:
+                self._renderBuffer(buf)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Renders all buffered log records and waits until they are written. Re-raises an
+        exception that happened while rendering them."""
+        self._submitBuffer()
+        if self._writer.is_alive():
+            self._queue.join()
         else:
-            sep = " "
-            kwargs["sep"] = sep
-        return super().print(f"[[{color}]{lvl:4s}[/{color}]]{sep}", *args, **kwargs)
+            while True:
+                try:
+                    buf = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._renderBuffer(buf)
+                self._queue.task_done()
+
+        if (e := self._writer_exc) is not None:
+            self._writer_exc = None
+            raise e
+
+    def print(self, *args, **kwargs):
+        # buffered records must precede anything printed after them
+        self.flush()
+        return self.console.print(*args, **kwargs)
 
     def will_log(self, level) -> bool:
         return self.log_level <= level
 
+    @staticmethod
+    def _noLog(*args, **kwargs):
+        pass
+
     def trace(self, *args, **kwargs):
-        if self.log_level > LoggingConsole.LogLevel.Trace:
-            return None
-        return self._do_log("blue", "trce", *args, **kwargs)
+        return self._do_log(self._kTracePfx, *args, **kwargs)
 
     def debug(self, *args, **kwargs):
-        if self.log_level > LoggingConsole.LogLevel.Debug:
-            return None
-        return self._do_log("bright_black", "dbg", *args, **kwargs)
+        return self._do_log(self._kDebugPfx, *args, **kwargs)
 
     def info(self, *args, **kwargs):
-        if self.log_level > LoggingConsole.LogLevel.Info:
-            return None
-        return self._do_log("bright_white", "info", *args, **kwargs)
+        return self._do_log(self._kInfoPfx, *args, **kwargs)
 
     def warning(self, *args, **kwargs):
-        if self.log_level > LoggingConsole.LogLevel.Warning:
-            return None
-        return self._do_log("yellow", "warn", *args, **kwargs)
+        self._do_log(self._kWarningPfx, *args, **kwargs)
+        self.flush()  # warnings are shown immediately
 
     def error(self, *args, **kwargs):
         self._n_errors += 1
-        if self.log_level > LoggingConsole.LogLevel.Error:
-            return None
-        return self._do_log("red", "Err", *args, **kwargs)
+        if not self._log_error:
+            return
+        self._do_log(self._kErrorPfx, *args, **kwargs)
+        self.flush()  # errors are shown immediately
 
     def failure(self, *args, **kwargs):
         self._n_errors += 1
-        if self.log_level > LoggingConsole.LogLevel.Failure:
-            return None
-        return self._do_log("bright_red", "FAIL", *args, **kwargs)
+        if not self._log_failure:
+            return
+        self._do_log(self._kFailurePfx, *args, **kwargs)
+        self.flush()  # errors are shown immediately
 
     def critical(self, *args, **kwargs):
         self._n_errors += 1
-        if self.log_level > LoggingConsole.LogLevel.Critical:
-            return None
-        return self._do_log("bright_magenta", "CRIT", *args, **kwargs)
+        if not self._log_critical:
+            return
+        self._do_log(self._kCriticalPfx, *args, **kwargs)
+        self.flush()  # errors are shown immediately
 
     def yacce_begin(self):
-        super().print("[bold bright_blue]==== YACCE >>>>>>>>[/bold bright_blue]")
+        self.flush()
+        self.console.print("[bold bright_blue]==== YACCE >>>>>>>>[/bold bright_blue]")
 
     def yacce_end(self):
-        super().print("[bold bright_blue]<<<<<<<< YACCE ====[/bold bright_blue]")
+        self.flush()
+        self.console.print("[bold bright_blue]<<<<<<<< YACCE ====[/bold bright_blue]")
 
 
 class PathFilter:
@@ -204,6 +329,25 @@ class BetterHelpFormatter(argparse.HelpFormatter):
         ]
 
 
+def _nonNegativeInt(s: str) -> int:
+    """argparse type for a non-negative integer argument."""
+    try:
+        v = int(s)
+    except ValueError:
+        v = -1
+    if v < 0:
+        raise argparse.ArgumentTypeError(f"'{s}' isn't a non-negative integer")
+    return v
+
+
+def _numUsableCpus() -> int:
+    """Number of CPUs the process is allowed to run on, which respects affinity masks and cpusets,
+    unlike os.cpu_count()."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
 def addCommonCliArgs(parser: argparse.ArgumentParser, addendums: dict = {}):
     """ "Adds arguments common for multiple modes to the given parser."""
     kWarnCustomField = (
@@ -382,6 +526,17 @@ def addCommonCliArgs(parser: argparse.ArgumentParser, addendums: dict = {}):
         default=False,
     )
 
+    parser.add_argument(
+        "--jobs",
+        help="Maximum number of worker processes to scan a large strace log file with. The events "
+        "found are still handled sequentially in the log order, so no more than "
+        f"{BaseParser.kMaxParallelScanJobs} workers are used anyway. 1 disables parallel "
+        "scanning, 0 uses a worker per available CPU.\nDefault: %(default)s.",
+        metavar="N",
+        type=_nonNegativeInt,
+        default=0,
+    )
+
     parser.add_argument(
         "-d",
         "--dest_dir",
@@ -408,7 +563,11 @@ def warnClangdIncompatibilitiesIfAny(Con: LoggingConsole, args: argparse.Namespa
         _warnField("save_line_num", "line_num")
 
 
-CompilersTuple = namedtuple("CompilersTuple", ["basenames", "prefixes", "suffixes", "fullpaths"])
+class CompilersTuple(NamedTuple):
+    basenames: frozenset[str]
+    prefixes: tuple[str, ...]
+    suffixes: tuple[str, ...]
+    fullpaths: frozenset[str]
 
 
 def _splitCompilerListByType(custom_compilers: list[str] | None) -> CompilersTuple:
@@ -424,9 +583,10 @@ def _splitCompilerListByType(custom_compilers: list[str] | None) -> CompilersTup
                 continue
             assert isinstance(cc, str)
 
-            if os.path.isabs(cc):
+            # same as os.path.isabs() and os.path.basename(cc) == cc tests on posix, but cheaper
+            if cc.startswith("/"):
                 paths.append(cc)
-            elif os.path.basename(cc) == cc:
+            elif "/" not in cc:
                 names.append(cc)
             elif cc.startswith("+"):
                 if len(cc) > 1:
@@ -443,44 +603,60 @@ def _splitCompilerListByType(custom_compilers: list[str] | None) -> CompilersTup
     )
 
 
+# compiler basenames yacce detects out of the box. Computed once at import
+kGccVers = (9, 18)
+kGccPfxs = ("", "x86_64-linux-gnu-")
+kClangVers = (10, 25)
+kStockCompilerBasenames = frozenset(
+    itertools.chain(
+        ("cc", "c++", "gcc", "g++", "clang", "clang++"),
+        (f"{pfx}{cc}-{v}" for cc in ("gcc", "g++") for v in range(*kGccVers) for pfx in kGccPfxs),
+        (f"{cc}-{v}" for cc in ("clang", "clang++") for v in range(*kClangVers)),
+    )
+)
+
+
 def _makeCompilersSet(custom_compilers: list[str] | None) -> CompilersTuple:
     """Adds custom compilers to the set of known compilers to find in strace log."""
 
     compilers = _splitCompilerListByType(custom_compilers)
-
-    kGccVers = (9, 18)
-    kGccPfxs = ("", "x86_64-linux-gnu-")
-    kClangVers = (10, 25)
-
-    basenames = frozenset(
-        ["cc", "c++", "gcc", "g++", "clang", "clang++"]
-        + [f"{pfx}gcc-{v}" for v in range(*kGccVers) for pfx in kGccPfxs]
-        + [f"{pfx}g++-{v}" for v in range(*kGccVers) for pfx in kGccPfxs]
-        + [f"clang-{v}" for v in range(*kClangVers)]
-        + [f"clang++-{v}" for v in range(*kClangVers)]
-        + list(compilers.basenames)
-    )
     # note there's not much point to try to prune the set of basenames or full paths, as a build system
     # could reference a compiler in a custom path, so we can't detect its presence on the machine.
 
     return CompilersTuple(
-        basenames=basenames,
+        basenames=kStockCompilerBasenames | compilers.basenames,
         prefixes=compilers.prefixes,
         suffixes=compilers.suffixes,
         fullpaths=compilers.fullpaths,
     )
 
 
-# line_num:int is the number (1 based index) of line in the log that spawned the process
-# is_other:bool is the command is other command
-# cmd_idx:int is the index of command in a corresponding list
-ProcessProps = namedtuple("ProcessProps", ("start_ts_us", "line_num", "is_other", "cmd_idx"))
-# args:list[str], output:str|None, sources:list[str], line_num:int
+# These are created for every command found in the log, so they're slotted dataclasses, which are
+# a bit more compact and faster to access by a field than namedtuples.
+@dataclass(slots=True)
+class ProcessProps:
+    start_ts_us: int
+    line_num: int  # the number (1 based index) of line in the log that spawned the process
+    is_other: bool  # is the command is other command
+    cmd_idx: int  # the index of command in a corresponding list
+
+
 # note that 'sources' are removed from args and should be put there during save to a file phase
-# Also note that sources and output are unescaped and must be escaped upon writing to JSON
-# All args should always be escaped
-CompileCommand = namedtuple("CompileCommand", ("args", "output", "sources", "line_num"))
-OtherCommand = namedtuple("OtherCommand", ("args", "output", "line_num"))
+# Also note that sources and output are unescaped, while all args should always be escaped.
+# storeJson() unescapes args and leaves escaping for JSON to the encoder
+@dataclass(slots=True)
+class CompileCommand:
+    args: list[str]
+    output: str | None
+    sources: list[str]
+    line_num: int
+
+
+@dataclass(slots=True)
+class OtherCommand:
+    args: list[str]
+    output: str | None
+    line_num: int
 
 
 class BaseParser:
@@ -600,6 +776,9 @@ class BaseParser:
         ".ccm",
     )
 
+    # finds a quoted arg that might be a source in the execve() args array
+    _r_source_probe = re.compile("(?:" + "|".join(re.escape(e) for e in kExtOfSource) + ')"')
+
     # if a path/file argument is preceded by any of the following flags, the arg is not a source
     kArgIsNotSource = frozenset(("-main-file-name",))
 
@@ -614,8 +793,9 @@ class BaseParser:
     # with the exception of the below args
     kArgStartsWithIgnoreInvocationException = ("--print-missing-file-dependencies",)
 
-    # greedy match repeatedly blocks ending on escaped quote \" literal, or that doesn't contain
-    # quotes at all until first unescaped quote
+    # matches a quoted string up to the first unescaped quote. Each char inside the quotes is
+    # consumed by exactly one alternative (an escape sequence, or a char that is neither a quote nor
+    # a backslash), so the regexp never backtracks catastrophically and runs in linear time.
     @staticmethod
     def _makeRInQuotes(capture_inner: bool, no_begin_end: bool) -> str:
         not_word_backslash = r"(?<=\W)(?<!\\)"
@@ -627,8 +807,7 @@ class BaseParser:
             # WARNING: never end a comment inside extended regexp with a backslash, even in raw
             # strings - it'll be treated as line continuation char
             + r"""
-            (?:(?:(?!(?P=quote)).)*(?:\\(?P=quote))*)*  # any sequence of not quotes and escaped quotes
-            (?<!\\)         # no escaping backslash in front of the ending quote
+            (?:(?!(?P=quote))[^\\\n]|\\.)*  # any sequence of not quotes and escape sequences
             )               # end of capture/group
             (?P=quote)      # ending quote
             """
@@ -636,12 +815,25 @@ class BaseParser:
             + (r"(?=\W)" if no_begin_end else r"(?:$|(?=\W))")
         )
 
-    _r_in_quotes = re.compile(_makeRInQuotes(True, False), re.VERBOSE)
-    # greedy match [] with any chars inside of ""
-    _r_in_braces = re.compile(r"^\[(?:[, ]*" + _makeRInQuotes(False, True) + r")*\]", re.VERBOSE)
-    # note that dependency of _r_in_braces on essentially _r_in_quotes definition is important as
-    # it allows to produce a string on which we can safely match individual arguments with _r_in_quotes.findall()
-    # in a batch, instead one by one to ensure correctness of parsing.
+    @staticmethod
+    def _findClosingQuote(line: str, pos: int) -> int:
+        """Returns the index of the quote that closes a double quoted string starting at pos, or -1
+        if there's no such string. strace quotes args only with double quotes and escapes them
+        inside, so for its output this does the same as the regexp made by _makeRInQuotes(), but
+        with str.find() instead of running the regexp engine char by char."""
+        if line[pos : pos + 1] != '"':
+            return -1
+        find = line.find
+        end = find('"', pos + 1)
+        # the quote is escaped if it's preceded by an odd number of backslashes
+        while end > 0 and line[end - 1] == "\\":
+            bs = end - 1
+            while line[bs - 1] == "\\":
+                bs -= 1
+            if (end - bs) % 2 == 0:
+                break
+            end = find('"', end + 1)
+        return end
 
     """ from https://gcc.gnu.org/onlinedocs/gcc/Overall-Options.html:
     Options in file are separated by whitespace. A whitespace character may be included
@@ -664,9 +856,30 @@ class BaseParser:
         re.VERBOSE,
     )
 
+    # args shorter than this are interned, longer ones are unlikely to repeat
+    kMaxInternedArgLen = 64
+
+    # how often (in bytes of the log) the log parsing progress bar is updated
+    kProgressStep = 1 << 20
+    # size of a log chunk to scan in a worker process. Logs smaller than two chunks are scanned in
+    # the main process
+    kParallelScanChunk = 4 << 20
+    # max number of worker processes scanning the log. Events of a chunk take a few times the chunk
+    # size in memory and handling them in the main process is the bottleneck, so more workers would
+    # only make the scanned chunks pile up in memory
+    kMaxParallelScanJobs = 4
+
     # ending of execve() line
     _r_execve_end = re.compile(r"\)\s*=\s*0\s*$")
 
+    # match the start of the log string: (<pid>) (<time.stamp>) (execve|execveat|exited...)
+    # The log is scanned as a whole in bytes mode, so the regexp finds the next interesting line
+    # on its own without iterating over (and decoding) every line of the log in Python.
+    _r_exec_or_exit = re.compile(
+        rb"^[ \t]*(?P<pid>\d+)[ \t]+(?P<unix_ts>\d+)\.(?P<unix_ts_ms>\d+)[ \t]+(?P<call>execve|execveat|\+\+\+ exited with (?P<exit_code>\d+) \+\+\+)",
+        re.MULTILINE,
+    )
+
     @staticmethod
     def _leadingPlusToDash(s: str) -> str:
         if s.startswith("++"):
@@ -686,6 +899,12 @@ class BaseParser:
         self._enable_compiler_scripts: bool = args.enable_compiler_scripts
         setattr(args, "not_compiler", _splitCompilerListByType(args.not_compiler))
         self._not_compilers: CompilersTuple = args.not_compiler
+        # when set, _isCompiler() result for a path depends only on the path's basename
+        self._compilers_by_basename_only = not (
+            self._compilers.prefixes or self._compilers.suffixes or self._compilers.fullpaths
+        )
+        # (path, basename) -> result of _isCompiler(). Compiler sets are immutable, so it's safe.
+        self._is_compiler_cache: dict[tuple[str, str], bool] = {}
 
         self._do_other = args.other_commands
         self._test_files = not args.ignore_not_found
@@ -708,6 +927,7 @@ class BaseParser:
         )
         self._discard_args = self._makeDiscardArgs(Con, args.discard_args)
         self._do_dupes_check = args.enable_dupes_check
+        self._max_jobs: int = args.jobs or _numUsableCpus()
 
         if self._test_files and not os.path.isdir(self._cwd):
             Con.warning(
@@ -720,9 +940,10 @@ class BaseParser:
         self._running_pids: dict[int, ProcessProps] = {}
 
         self.compile_commands: list[CompileCommand] = []
-        self.compile_cmd_time: list[float] = []
+        # durations are kept in typed arrays, 8 bytes per entry instead of a whole float object
+        self.compile_cmd_time = array.array("d")
         self.other_commands: list[OtherCommand] = []
-        self.other_cmd_time: list[float] = []
+        self.other_cmd_time = array.array("d")
         # errors = {} # error_code -> array of line_idx where it happened
 
         self._parseLog(args.log_file)
@@ -766,11 +987,6 @@ class BaseParser:
         return ret
 
     def _parseLog(self, log_file: str) -> None:
-        # match the start of the log string: (<pid>) (<time.stamp>) (execve|execveat|exited...)
-        r_exec_or_exit = re.compile(
-            r"^(?P<pid>\d+)\s+(?P<unix_ts>\d+)\.(?P<unix_ts_ms>\d+)\s+(?P<call>execve|execveat|\+\+\+ exited with (?P<exit_code>\d+) \+\+\+)"
-        )
-
         # maps source->{output: (args_str, line_num)} to verify that commands are unique
         self._seen_compile: dict[str, dict[str | None, tuple[str, int]]] = {}
         self._seen_other: dict[str | None, tuple[str, int]] = {}  # just output->(args_str,line_num)
@@ -781,76 +997,46 @@ class BaseParser:
         self._compiler_is_script = set()
         self._not_script = set()
 
-        with rich.progress.open(
-            log_file, "r", description="Parsing strace log file...", console=self.Con
-        ) as file:
-            # sometimes strace breaks reporting of a single execve() call in two lines. All known
-            # cases of that have the first line ending on `<unfinished ...>` literal and the next
-            # line starting with `)` literal. We have to handle this
-            unfinished_line: str | None = None
-            unfinished_args: tuple | None = None
-            for line_idx, line in enumerate(file):
-                line = line.strip()  # dropping line-ends and other whitespaces
-                # handling line continuations
-                if unfinished_line is not None:
-                    prev_line = unfinished_line
-                    unfinished_line = None
-                    assert isinstance(unfinished_args, tuple) and len(unfinished_args) == 4
-                    if line.startswith(")"):
-                        self._handleExec(*unfinished_args, prev_line + line)
-                        continue
-                    else:
-                        self.Con.error(
-                            "Line",
-                            line_idx + 1,
-                            "has unexpected continuation pattern. Treating this and prev lines as independent.",
-                        )
-                        self._handleExec(*unfinished_args, prev_line)
-                        # falldown to processing below
-
-                match_exec_or_exit = r_exec_or_exit.match(line)
-                if not match_exec_or_exit:
-                    unfinished_line = None
-                    continue  # nothing to do here
-
-                pid = int(match_exec_or_exit.group("pid"))
-                ts = float(match_exec_or_exit.group("unix_ts")) + float(
-                    1e-6 * int(match_exec_or_exit.group("unix_ts_ms"))
-                )
-                call = match_exec_or_exit.group("call")
-                exit_code = match_exec_or_exit.group("exit_code")  # could be None
-
-                if call.startswith("+++ "):
-                    unfinished_line = None
-                    if pid not in self._running_pids:
-                        continue  # this must be not a process we care about
-                    self._handleExit(pid, ts, exit_code, line_idx + 1)
-                else:
-                    # handle execve/execveat here
-                    if line.endswith("<unfinished ...>"):
-                        unfinished_line = line[match_exec_or_exit.end() :]
-                        unfinished_args = (call, pid, ts, line_idx + 1)
-                        self.Con.trace(
-                            "Line",
-                            line_idx + 1,
-                            "pid",
-                            pid,
-                            "is unfinished. Deferring processing to the next line.",
-                        )
-                    else:
-                        self._handleExec(
-                            call, pid, ts, line_idx + 1, line[match_exec_or_exit.end() :]
-                        )
-            if unfinished_line is not None:
-                self.Con.error(
-                    "Previous line is marked as unfinished, but this was the last line. Trying to handle it"
+        import rich.progress
+
+        log_size = os.path.getsize(log_file)
+        progress = rich.progress.Progress(
+            rich.progress.TextColumn("[progress.description]{task.description}"),
+            rich.progress.BarColumn(),
+            rich.progress.DownloadColumn(),
+            rich.progress.TimeRemainingColumn(),
+            console=self.Con.console,
+        )
+        with open(log_file, "rb") as file, progress:
+            task = progress.add_task("Parsing strace log file...", total=log_size)
+            # mmap() can't map an empty file
+            log = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if log_size > 0 else b""
+            if log_size > 0:
+                self._adviseSequential(log, 0, log_size)
+
+            n_jobs = min(
+                self._max_jobs, self.kMaxParallelScanJobs, log_size // self.kParallelScanChunk
+            )
+            if n_jobs > 1:
+                # scanning of the log is offloaded to worker processes, while the events found are
+                # handled here strictly in the log order, since handling is stateful
+                for chunk_end, events in self._scanLogParallel(log_file, log, n_jobs):
+                    self._handleLogEvents(events)
+                    progress.update(task, completed=chunk_end)
+            else:
+                self._handleLogEvents(
+                    self._scanLog(log, 0, len(log)),
+                    lambda pos: progress.update(task, completed=pos),
                 )
-                assert isinstance(unfinished_args, tuple) and len(unfinished_args) == 4
-                self._handleExec(*unfinished_args, unfinished_line)
+
+            if isinstance(log, mmap.mmap):
+                log.close()
+            progress.update(task, completed=log_size)
+            self.Con.flush()  # buffered records must be rendered above the progress bar
 
         # finishing unfinished processes
         for pid in list(self._running_pids.keys()):  # must rematerialize since exit() deletes them
-            self._handleExit(pid, 0.0, None, 0)
+            self._handleExit(pid, 0, None, 0)
 
         assert 0 == len(self._running_pids)
         n_cc = len(self.compile_commands)
@@ -887,7 +1073,11 @@ class BaseParser:
                 "If you think these should be supported, consider making a PR or reporting an issue."
             )
 
-        if not self._enable_compiler_scripts and self._compiler_is_script:
+        if (
+            not self._enable_compiler_scripts
+            and self._compiler_is_script
+            and self.Con.will_log(self.Con.LogLevel.Trace)  # don't sort what won't be shown
+        ):
             self.Con.trace(
                 "In total",
                 len(self._compiler_is_script),
@@ -902,9 +1092,166 @@ class BaseParser:
         del self._seen_other
         del self._seen_compile
 
-    def _handleExit(self, pid: int, ts: float, exit_code: str | None, line_num: int) -> None:
+    # values of the 'unfinished' field of a log event. Sometimes strace breaks reporting of a single
+    # execve() call in two lines. All known cases of that have the first line ending on
+    # `<unfinished ...>` literal and the next line starting with `)` literal. We have to handle this
+    kLineFinished = 0
+    kLineJoined = 1  # the line was joined with the next one
+    kLineUnfinishedLast = 2  # the line is unfinished, but it's the last line of the log
+    kLineBadContinuation = 3  # the line is unfinished, but the next line isn't its continuation
+
+    @staticmethod
+    def _scanLog(log, beg: int, end: int):
+        """Generates events for execve() and exit lines that start in [beg, end) range of the log.
+        The range must start at a line start. Events are tuples of
+        (pos, line_num, pid, ts, call, exit_code, line, unfinished), where pos is a position in the
+        log the event ends at, line_num is a 1 based line number relative to the beg, ts is an
+        integer timestamp in microseconds, and for exit events call and line are None, while
+        exit_code is bytes. For execve() events exit_code is None.
+        Doesn't use any state, so could be run in a separate process."""
+        pos = beg  # position in the log to continue scanning from
+        line_num = 1  # 1 based number of the line containing pos
+        log_len = len(log)
+
+        search_exec_or_exit = BaseParser._r_exec_or_exit.search
+        # newlines are counted incrementally between matches, so each byte is counted only once
+        while match_exec_or_exit := search_exec_or_exit(log, pos, end):
+            # mmap doesn't have .count(), so a (cheap, compared to the search) slice copy is needed
+            line_num += log[pos : match_exec_or_exit.start()].count(b"\n")
+            pos = log.find(b"\n", match_exec_or_exit.end())
+            if pos < 0:
+                pos = log_len
+
+            # a single groups() call is cheaper than looking up each named group
+            pid, unix_ts, unix_ts_ms, call, exit_code = match_exec_or_exit.groups()
+            pid = int(pid)
+            # integer microseconds are exact and cheaper than float arithmetic
+            ts = int(unix_ts) * 1_000_000 + int(unix_ts_ms)
+
+            if exit_code is not None:
+                # most of the processes exit with 0, so the code is decoded only to be reported
+                yield (pos, line_num, pid, ts, None, exit_code, None, 0)
+                continue
+
+            # handle execve/execveat here
+            call = call.decode()
+            line = log[match_exec_or_exit.end() : pos].rstrip().decode()
+            if not line.endswith("<unfinished ...>"):
+                yield (pos, line_num, pid, ts, call, None, line, BaseParser.kLineFinished)
+                continue
+
+            if pos + 1 >= log_len:  # no next line
+                yield (pos, line_num, pid, ts, call, None, line, BaseParser.kLineUnfinishedLast)
+                continue
+
+            # the next line could belong to the next range, that's fine, it's never matched there
+            next_end = log.find(b"\n", pos + 1)
+            if next_end < 0:
+                next_end = log_len
+            next_line = log[pos + 1 : next_end].strip()
+            if next_line.startswith(b")"):
+                line += next_line.decode()
+                pos = next_end
+                yield (pos, line_num, pid, ts, call, None, line, BaseParser.kLineJoined)
+                line_num += 1
+            else:
+                yield (pos, line_num, pid, ts, call, None, line, BaseParser.kLineBadContinuation)
+
+    @staticmethod
+    def _adviseSequential(log: mmap.mmap, beg: int, end: int) -> None:
+        """Hints the kernel that [beg, end) range of the mapped log is going to be read sequentially,
+        so it reads ahead more aggressively. madvise() isn't available on every platform."""
+        if hasattr(mmap, "MADV_SEQUENTIAL") and end > beg:
+            beg -= beg % mmap.PAGESIZE  # the range must start at a page boundary
+            log.madvise(mmap.MADV_SEQUENTIAL, beg, end - beg)
+
+    @staticmethod
+    def _scanLogChunk(log_file: str, beg: int, end: int) -> tuple[int, list[tuple]]:
+        """Worker process entry point. Returns the number of newlines in [beg, end) range of the log
+        and a list of _scanLog() events found there."""
+        with (
+            open(log_file, "rb") as file,
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log,
+        ):
+            BaseParser._adviseSequential(log, beg, end)
+            return log[beg:end].count(b"\n"), list(BaseParser._scanLog(log, beg, end))
+
+    def _scanLogParallel(self, log_file: str, log, n_jobs: int):
+        """Scans the log in chunks in n_jobs worker processes. Generates in the log order tuples of
+        (chunk end, list of chunk events with line_num fixed to be absolute)."""
+        log_len = len(log)
+        chunks = []
+        beg = 0
+        while beg < log_len:  # aligning chunk boundaries to line starts
+            end = log.find(b"\n", min(beg + self.kParallelScanChunk, log_len) - 1) + 1
+            end = end if end > 0 else log_len
+            chunks.append((beg, end))
+            beg = end
+
+        n_lines = 0  # number of lines before the current chunk
+        # the log writer and the progress bar threads are running, so fork() is unsafe here
+        with concurrent.futures.ProcessPoolExecutor(
+            n_jobs, mp_context=multiprocessing.get_context("forkserver")
+        ) as pool:
+            # submitting chunks only as the results are consumed, so at most n_jobs + 1 chunks are
+            # in memory: n_jobs being scanned or waiting, and one being handled by the caller
+            pending = deque()
+            for beg, end in chunks:
+                pending.append((end, pool.submit(BaseParser._scanLogChunk, log_file, beg, end)))
+                if len(pending) <= n_jobs:
+                    continue
+                end, future = pending.popleft()
+                n_newlines, events = future.result()
+                yield end, [(e[0], e[1] + n_lines, *e[2:]) for e in events]
+                n_lines += n_newlines
+            for end, future in pending:
+                n_newlines, events = future.result()
+                yield end, [(e[0], e[1] + n_lines, *e[2:]) for e in events]
+                n_lines += n_newlines
+
+    def _handleLogEvents(self, events, f_progress=None) -> None:
+        """Handles events generated by _scanLog(). f_progress(pos) is invoked from time to time"""
+        reported_pos = 0  # the last position reported to the progress bar
+        # binding what's used for every event to locals
+        running_pids = self._running_pids
+        handle_exit, handle_exec = self._handleExit, self._handleExec
+        line_finished = self.kLineFinished
+        progress_step = self.kProgressStep if f_progress is not None else None
+        for pos, line_num, pid, ts, call, exit_code, line, unfinished in events:
+            if progress_step is not None and pos - reported_pos >= progress_step:
+                f_progress(pos)
+                reported_pos = pos
+
+            if exit_code is not None:
+                if pid not in running_pids:
+                    continue  # this must be not a process we care about
+                handle_exit(pid, ts, exit_code, line_num)
+                continue
+
+            if unfinished != line_finished:
+                self.Con.trace(
+                    "Line",
+                    line_num,
+                    "pid",
+                    pid,
+                    "is unfinished. Deferring processing to the next line.",
+                )
+                if unfinished == self.kLineUnfinishedLast:
+                    self.Con.error(
+                        "Previous line is marked as unfinished, but this was the last line. Trying to handle it"
+                    )
+                elif unfinished == self.kLineBadContinuation:
+                    self.Con.error(
+                        "Line",
+                        line_num + 1,
+                        "has unexpected continuation pattern. Treating this and prev lines as independent.",
+                    )
+            handle_exec(call, pid, ts, line_num, line)
+
+    def _handleExit(self, pid: int, ts: int, exit_code: bytes | None, line_num: int) -> None:
         # negative exit code means the process termination was not found in the log
-        (start_ts, start_line_num, is_other, cmd_idx) = self._running_pids[pid]
+        props = self._running_pids[pid]
+        start_ts, start_line_num = props.start_ts_us, props.line_num
 
         is_exit_logged = line_num > 0
         if is_exit_logged:  # <=0 line_idx is used when we didn't find the process exit in the log
@@ -915,19 +1262,19 @@ class BaseParser:
             # so there's no point to try to continue. However, even if the exit code is non-zero,
             # we could at least save the other commands to compile_commands.json.
 
-            if exit_code != "0":
+            if exit_code != b"0":
                 self.Con.warning(
                     f"Line {line_num}: pid {pid} (started at line {start_line_num}) exited with "
-                    f"non-zero exit code {exit_code}. This might mean the build wasn't successful "
-                    "and the resulting .json might be incomplete."
+                    f"non-zero exit code {exit_code.decode()}. This might mean the build wasn't "
+                    "successful and the resulting .json might be incomplete."
                 )
 
             if ts < start_ts:
                 # depending on used clock type, this might happen due to clock adjustments
                 self.Con.warning(
                     f"Line {line_num}: pid {pid} (started at line {start_line_num}) exited at time "
-                    f"{ts:.6f} which is before it started at "
-                    f"{start_ts:.6f}. Continuing, but the log file might be malformed."
+                    f"{ts / 1e6:.6f} which is before it started at "
+                    f"{start_ts / 1e6:.6f}. Continuing, but the log file might be malformed."
                 )
         else:
             self.Con.warning(
@@ -935,11 +1282,11 @@ class BaseParser:
                 "This might mean the log file is incomplete and hence so is the resulting .json."
             )
 
-        duration = ts - start_ts if is_exit_logged else 0.0
-        if is_other:
-            self.other_cmd_time[cmd_idx] = duration
+        duration = (ts - start_ts) / 1e6 if is_exit_logged else 0.0
+        if props.is_other:
+            self.other_cmd_time[props.cmd_idx] = duration
         else:
-            self.compile_cmd_time[cmd_idx] = duration
+            self.compile_cmd_time[props.cmd_idx] = duration
 
         del self._running_pids[pid]
 
@@ -974,6 +1321,16 @@ class BaseParser:
         return ret
 
     def _isCompiler(self, compiler_path: str, compiler_basename: str) -> bool:
+        # the same few compilers are invoked over and over, so the classification is memoized
+        key = (compiler_path, compiler_basename)
+        ret = self._is_compiler_cache.get(key)
+        if ret is None:
+            ret = self._is_compiler_cache[key] = self._classifyCompiler(
+                compiler_path, compiler_basename
+            )
+        return ret
+
+    def _classifyCompiler(self, compiler_path: str, compiler_basename: str) -> bool:
         if (
             compiler_path not in self._compilers.fullpaths
             and compiler_basename not in self._compilers.basenames
@@ -1032,12 +1389,12 @@ class BaseParser:
 
         if abs_path:  # we shouldn't apply realpath to a non abs-path, as it might resolve wrongly
             orig_path = path
-            path = os.path.realpath(path)
+            path = cachedRealPath(path)
             if try_reject and orig_path != path and f_reject_true(path):
                 return None
 
             # only check existence when abspath is known, otherwise the result is UB
-            if self._test_files and not os.path.exists(path):
+            if self._test_files and not realPathExists(path):
                 self.Con.warning(
                     f"Line {lpa[0]}: pid {lpa[1]} uses argument '{orig_arg}' "
                     "which doesn't exist. This might mean the build system is misconfigured "
@@ -1074,7 +1431,7 @@ class BaseParser:
             )
         return exp_path
 
-    def _handleExec(self, call: str, pid: int, ts: float, line_num: int, line: str) -> None:
+    def _handleExec(self, call: str, pid: int, ts: int, line_num: int, line: str) -> None:
         assert pid not in self._running_pids  # should be checked by the caller
         """assert call in ("execve", "execveat"), (
             f"Line {line_idx}: pid {pid} made call {call}. The code is inconsistent "
@@ -1091,39 +1448,88 @@ class BaseParser:
             self.Con.warning(f"Line {line_num}: pid {pid}: unexpected end of '{line}'.")
 
         # extract the first argument of execve, which is the executable path
-        match_filepath = self._r_in_quotes.match(line[1:])
-        assert match_filepath, (
+        path_end = self._findClosingQuote(line, 1)
+        assert path_end > 0, (
             f"Line {line_num}: pid {pid} made call {call} but the argument '{line}' can't be parsed. "
-            "The log file is malformed or _r_in_quotes regexp is incorrect"
+            "The log file is malformed"
         )
+        exec_path = line[2:path_end]
+
+        # Most of the executed binaries aren't compilers. A plain (not escaped) executable path is
+        # the same path _ignoreExecutable() tests first, so it could be rejected right away without
+        # parsing the rest of the line
+        if "\\" not in exec_path:
+            basename = exec_path[exec_path.rfind("/") + 1 :]
+            if self._compilers_by_basename_only:
+                if basename not in self._compilers.basenames:
+                    return
+            elif exec_path[0:1] != "~" and not self._isCompiler(exec_path, basename):
+                return  # ~ would be expanded first
 
-        exec_path = match_filepath.group(2)
         if self._ignoreExecutable(exec_path, (line_num, pid)):
             return
 
         # finding execv() args in the rest of the line
-        args_start_pos = match_filepath.end() + 3
-        # +1 since match_filepath is matched on args[1:]
-        assert line[match_filepath.end() + 1 : args_start_pos + 1] == ", [", (
+        args_start_pos = path_end + 3
+        assert line[path_end + 1 : args_start_pos + 1] == ", [", (
             f"Unexpected format of the {call} syscall in the log file"
         )
-        # we can't simply search for the closing ] because there might be braces in file names and
-        # they don't have to be shell-escaped
-        match_args = self._r_in_braces.match(line[args_start_pos:])
-        assert match_args, (
+        # When other commands aren't needed, a command without sources is of no interest. Any source
+        # arg ends with a known extension right before the closing quote, unless it's in an @file
+        if (
+            not self._do_other
+            and not self._r_source_probe.search(line, args_start_pos)
+            and '"@' not in line
+        ):
+            return
+
+        # We can't simply search for the closing ] because there might be braces in file names and
+        # they don't have to be shell-escaped. We also can't split by ", " because there might be
+        # such sequence in file names. So we walk the array once, finding the closing quote of each
+        # argument right after the previous one, which both validates the array and extracts the
+        # args in one pass.
+        # However, when there's no escaped quote in the array, every quote is a delimiter, so the
+        # array is just args joined with '", "' and closed with '"]' that follows an even number of
+        # quotes (an odd number means the '"' opens an arg starting with ']'). This is the most
+        # common case and it's handled with a few str methods instead of walking arg by arg.
+        args = []
+        pos = -1
+        # the same flags and include dirs repeat over all the commands, so sharing them
+        max_interned_len = self.kMaxInternedArgLen
+        if line[args_start_pos + 1 : args_start_pos + 2] == '"':
+            arr_end = line.find('"]', args_start_pos)
+            while arr_end > 0 and line.count('"', args_start_pos, arr_end + 1) % 2:
+                arr_end = line.find('"]', arr_end + 1)
+            if arr_end > 0 and '\\"' not in line[args_start_pos : arr_end + 1]:
+                parts = line[args_start_pos + 2 : arr_end].split('", "')
+                # only if all args are separated exactly by ", "
+                if 2 * len(parts) == line.count('"', args_start_pos, arr_end + 1):
+                    args = [
+                        sys.intern(arg) if len(arg) < max_interned_len else arg for arg in parts
+                    ]
+                    pos = arr_end + 1
+
+        if pos < 0:
+            find_closing_quote = self._findClosingQuote
+            line_len = len(line)
+            pos = args_start_pos + 1
+            while True:
+                while pos < line_len and line[pos] in ", ":
+                    pos += 1
+                arg_end = find_closing_quote(line, pos)
+                if arg_end < 0:
+                    break
+                arg = line[pos + 1 : arg_end]
+                args.append(sys.intern(arg) if len(arg) < max_interned_len else arg)
+                pos = arg_end + 1
+        assert line[pos : pos + 1] == "]", (
             f"Line {line_num}: pid {pid} made call {call} but the arguments array couldn't be parsed. "
-            "The log file is malformed or _r_in_braces regexp is incorrect"
+            "The log file is malformed"
         )
 
-        args_str = match_args.group()
+        args_str = line[args_start_pos : pos + 1]
         lpa = (line_num, pid, args_str)
 
-        # Extracting args from the args_str. We can't simply split by ", " because there might be
-        # such sequence in file names. So we use the same rInQuotes regexp to extract them one by one.
-        # In a sense, it's a duplication of application of the same regexp as above, but we must
-        # scope the search to the inside of the braces only
-        args = [inner for _, inner in re.findall(self._r_in_quotes, args_str)]
-
         if self._shouldIgnoreInvocation(args, line_num, pid, args_str):
             return
         args = self._expandAtFile(args, line_num, pid)
@@ -1268,27 +1674,36 @@ class BaseParser:
             )
             return True
 
+        # args_str could be huge, so formatting messages only when they are going to be logged
+        do_trace = self.Con.will_log(self.Con.LogLevel.Trace)
         if args_len == 2 and args[1] in self.kSoleArgToIgnoreInvocation:
-            self.Con.trace(
-                f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to a sole arg in kSoleArgToIgnoreInvocation"
-            )
+            if do_trace:
+                self.Con.trace(
+                    f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to a sole arg in kSoleArgToIgnoreInvocation"
+                )
             return True
 
-        if any(1 for a in args if a in self.kArgToIgnoreInvocation):
-            self.Con.trace(
-                f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to an arg in kArgToIgnoreInvocation"
-            )
-            return True
+        # a single pass over args for both checks. kArgToIgnoreInvocation takes precedence in reporting
+        has_ignored_pfx = False
+        for a in args:
+            if a in self.kArgToIgnoreInvocation:
+                if do_trace:
+                    self.Con.trace(
+                        f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to an arg in kArgToIgnoreInvocation"
+                    )
+                return True
+            if (
+                not has_ignored_pfx
+                and a.startswith(self.kArgStartsWithIgnoreInvocation)
+                and a not in self.kArgStartsWithIgnoreInvocationException
+            ):
+                has_ignored_pfx = True
 
-        if any(
-            1
-            for a in args
-            if a.startswith(self.kArgStartsWithIgnoreInvocation)
-            and a not in self.kArgStartsWithIgnoreInvocationException
-        ):
-            self.Con.trace(
-                f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to an arg satisfying kArgStartsWithIgnoreInvocation"
-            )
+        if has_ignored_pfx:
+            if do_trace:
+                self.Con.trace(
+                    f"Line{line_num} pid{pid}: invocation '{args_str}' is ignored due to an arg satisfying kArgStartsWithIgnoreInvocation"
+                )
             return True
 
         return False
@@ -1446,98 +1861,137 @@ def storeJson(
     Con: LoggingConsole,
     path: str,
     is_compile_commands: bool,
-    commands: list[CompileCommand] | list[OtherCommand],
-    cmd_times: list[float] | None,
+    commands: Iterable[CompileCommand] | Iterable[OtherCommand],
+    cmd_times: Iterable[float] | None,
     cwd: str,
     save_line_num: bool,
     file_sfx="",
 ):
+    """Saves commands to a .json file. Commands and their times could be any iterables, including
+    one-shot iterators, which lets callers stream commands from several lists without merging."""
     filename = os.path.join(
         path, ("compile" if is_compile_commands else "other") + f"_commands{file_sfx}.json"
     )
     if os.path.exists(filename):
         os.remove(filename)
 
-    if not commands:
-        assert not cmd_times
+    commands = iter(commands)
+    if (e := next(commands, None)) is None:
         Con.info("storeJson() got empty list to save into '", filename, "'")
         return
+    commands = itertools.chain((e,), commands)
 
-    save_duration = cmd_times is not None
-    assert not save_duration or len(commands) == len(cmd_times)
-
-    e = next(iter(commands))
     is_other = isinstance(e, OtherCommand)
     assert is_other or isinstance(e, CompileCommand)
     assert int(is_other) + int(is_compile_commands) == 1
 
-    cwd = escapePath(cwd)
-    n_written = 0
-    with open(filename, "w") as f:
-        f.write("[\n")
-        if is_compile_commands:
-            n_written = _storeCompileCommands(f, commands, cwd, save_line_num, cmd_times)  # type: ignore
-        else:
-            n_written = _storeOtherCommands(f, commands, cwd, save_line_num, cmd_times)  # type: ignore
-        f.write("]\n")
+    if is_compile_commands:
+        records = _makeCompileRecords(commands, save_line_num, cmd_times)  # type: ignore
+    else:
+        records = _makeOtherRecords(commands, save_line_num, cmd_times)  # type: ignore
+    with open(filename, "wb", buffering=kJsonWriteBufferSize) as f:
+        n_written = _writeJson(f, records, cwd)
     Con.print("Written", n_written, "commands to", filename)
 
 
-def _storeCompileCommands(
-    f, commands: list[CompileCommand], cwd: str, save_line_num: bool, cmd_times: list[float] | None
-) -> int:
-    save_duration = bool(cmd_times)
+# number of records to encode and write to a .json file at once
+kJsonRecordsPerWrite = 1024
+kJsonWriteBufferSize = 1 << 20
+
+
+def _writeJson(f, records: Iterable[dict], cwd: str) -> int:
+    """Writes records as a JSON array, one record per line, encoding them with orjson if it's
+    available or with the stdlib json otherwise. Both are C-accelerated and do all the escaping.
+    Records are consumed and written in batches: few large writes without keeping all the records
+    or the whole file in memory. Returns the number of records written.
+    Records must not have the "directory" field, it's the same for all of them and is prepended
+    to each encoded non-empty record as is. A "duration_s" field, if any, is written right after it
+    with a microsecond precision, since the encoders format floats differently. Both encoders are
+    set up to produce the same bytes for everything else."""
+    if orjson is not None:
+        dumps = orjson.dumps
+    else:
+        # orjson's compact format, with non-ASCII chars as is in UTF-8
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+        def dumps(rec: dict) -> bytes:
+            return encode(rec).encode()
+
+    # '{"directory":"cwd",' - the beginning of each record
+    dir_head = dumps({"directory": cwd})[:-1] + b","
+
+    def dumps_rec(rec: dict) -> bytes:
+        duration = rec.pop("duration_s", None)
+        if duration is None:
+            return dir_head + dumps(rec)[1:]
+        return b'%s"duration_s":%.6f,%s' % (dir_head, duration, dumps(rec)[1:])
+
     n_written = 0
-    for idx, cmd_tuple in enumerate(commands):
-        args, arg_output, sources, line_num = cmd_tuple
-        for src in sources:
-            f.write(("," if n_written > 0 else "") + "{\n")
-            f.write(f' "directory": "{cwd}",\n')
-            esc_src = escapePath(src)
-            f.write(f' "file": "{esc_src}",\n')
+    records = iter(records)
+    f.write(b"[\n")
+    while batch := list(itertools.islice(records, kJsonRecordsPerWrite)):
+        encoded = b",\n".join(map(dumps_rec, batch))
+        f.write(b",\n" + encoded if n_written > 0 else encoded)
+        n_written += len(batch)
+    f.write(b"\n]\n")
+    return n_written
 
+
+def _makeCompileRecords(
+    commands: Iterable[CompileCommand], save_line_num: bool, cmd_times: Iterable[float] | None
+) -> Iterator[dict]:
+    """Yields records without the "directory" field, see _writeJson()"""
+    save_duration = cmd_times is not None
+    if not save_duration:
+        cmd_times = itertools.repeat(0.0)
+    for cmd, cmd_time in zip(commands, cmd_times, strict=save_duration):  # type: ignore
+        args, arg_output, sources, line_num = cmd.args, cmd.output, cmd.sources, cmd.line_num
+        # args are stored escaped the same way strace escapes them, while the encoder needs raw values
+        args = [unescapePath(a) for a in args]
+        for src in sources:
+            rec = {"file": src}
             if save_line_num:
-                f.write(f' "line_num": {line_num},\n')
+                rec["line_num"] = line_num
             if save_duration:
-                f.write(f' "duration_s": {cmd_times[idx]:.6f},\n')
+                rec["duration_s"] = cmd_time
             if arg_output is not None:
-                f.write(f' "output": "{escapePath(arg_output)}",\n')
+                rec["output"] = arg_output
+            rec["arguments"] = args + [src]
+            yield rec
 
-            args_str = '", "'.join(args + [esc_src])
-            f.write(f' "arguments": ["{args_str}"]\n')
-            f.write("}\n")
-            n_written += 1
-    return n_written
-
-
-def _storeOtherCommands(
-    f, commands: list[OtherCommand], cwd: str, save_line_num: bool, cmd_times: list[float] | None
-) -> int:
-    save_duration = bool(cmd_times)
-    for idx, cmd_tuple in enumerate(commands):
-        f.write(("," if idx > 0 else "") + "{\n")
-        f.write(f' "directory": "{cwd}",\n')
-        args, arg_output, line_num = cmd_tuple
 
+def _makeOtherRecords(
+    commands: Iterable[OtherCommand], save_line_num: bool, cmd_times: Iterable[float] | None
+) -> Iterator[dict]:
+    """Yields records without the "directory" field, see _writeJson()"""
+    save_duration = cmd_times is not None
+    if not save_duration:
+        cmd_times = itertools.repeat(0.0)
+    for cmd, cmd_time in zip(commands, cmd_times, strict=save_duration):  # type: ignore
+        args, arg_output, line_num = cmd.args, cmd.output, cmd.line_num
+        rec = {}
         if save_line_num:
-            f.write(f' "line_num": {line_num},\n')
+            rec["line_num"] = line_num
         if save_duration:
-            f.write(f' "duration_s": {cmd_times[idx]:.6f},\n')
+            rec["duration_s"] = cmd_time
         if arg_output is not None:
-            f.write(f' "output": "{escapePath(arg_output)}",\n')
-
-        args_str = '", "'.join(args)
-        f.write(f' "arguments": ["{args_str}"]\n')
-        f.write("}\n")
-    return len(commands)
+            rec["output"] = arg_output
+        rec["arguments"] = [unescapePath(a) for a in args]
+        yield rec
 
 
 def unescapePath(path: str) -> str:
-    # not sure this is correct
-    return path.replace('\\"', '"').encode("latin1").decode("unicode_escape")
+    # the vast majority of paths have nothing escaped, so there's no need to run them through codecs
+    if "\\" not in path:
+        return path
+    # not sure this is correct. backslashreplace lets non-latin1 chars survive the round-trip
+    return path.replace('\\"', '"').encode("latin1", "backslashreplace").decode("unicode_escape")
 
 
 def escapePath(path: str) -> str:
+    # same here, printable ascii without quotes and backslashes is left intact by the codec
+    if path.isascii() and path.isprintable() and '"' not in path and "\\" not in path:
+        return path
     return path.encode("unicode_escape").decode("latin1").replace('"', '\\"')
 
 
@@ -1545,8 +1999,50 @@ def toAbsPathUnescape(cwd: str, path: str) -> str:
     path = os.path.expanduser(unescapePath(path))
     if not os.path.isabs(path):
         path = os.path.join(cwd, path)
-    return os.path.realpath(path)  # resolve symlinks so isfile() or isdir() works properly
+    return cachedRealPath(path)  # resolve symlinks so isfile() or isdir() works properly
+
+
+# The filesystem is assumed not to change while yacce processes a log, so resolved directories and
+# directory listings are cached for the lifetime of the process
+@functools.cache
+def _realDirPath(dir_path: str) -> str:
+    return os.path.realpath(dir_path)
+
+
+def cachedRealPath(path: str) -> str:
+    """os.path.realpath() that resolves each parent directory only once. Paths found in a build log
+    usually share just a few parent dirs, so for most of them this is a single lstat() instead
+    of a walk over every path component. Relative paths aren't cached, as they depend on cwd."""
+    head, tail = os.path.split(path)
+    if not tail or tail == "." or tail == ".." or not os.path.isabs(head):
+        return os.path.realpath(path)
+    path = os.path.join(_realDirPath(head), tail)
+    return os.path.realpath(path) if os.path.islink(path) else path
+
+
+@functools.cache
+def _dirEntries(dir_path: str) -> frozenset[str]:
+    return frozenset(os.listdir(dir_path))
+
+
+def realPathExists(path: str) -> bool:
+    """Tests existence of an absolute path that went through os.path.realpath() already.
+    Sources of a build are usually spread over a much smaller number of directories, so a single
+    listing of each directory is way cheaper than a stat() per path. Since realpath() has
+    resolved all symlinks, the basename can't be a live symlink, so directory membership is
+    existence. Note that the listing is cached for the lifetime of the process."""
+    dir_path, basename = os.path.split(path)
+    if not basename:
+        return os.path.exists(path)
+    try:
+        return basename in _dirEntries(dir_path)
+    except FileNotFoundError:
+        return False
+    except OSError:  # not a dir, no permissions, etc. Let stat() decide
+        return os.path.exists(path)
 
 
+# the same include dirs and files are checked for each compiler invocation, so caching the result
+@functools.cache
 def unescapedPathExists(cwd: str, path: str) -> bool:
-    return os.path.exists(toAbsPathUnescape(cwd, path))
+    return realPathExists(toAbsPathUnescape(cwd, path))
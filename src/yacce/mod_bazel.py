@@ -1,8 +1,10 @@
 import argparse
+import array
+from collections import defaultdict
+import functools
 import itertools
 import os
 import re
-from rich.progress import Progress
 import shutil
 import signal
 import subprocess
@@ -19,12 +21,14 @@ from .common import (
     addCommonCliArgs,
     BaseParser,
     BetterHelpFormatter,
+    cachedRealPath,
     CompileCommand,
     escapePath,
     # OtherCommand,
     kCommonEpilog,
     kMainDescription,
     LoggingConsole,
+    realPathExists,
     storeJson,
     unescapePath,
     YacceException,
@@ -192,13 +196,11 @@ def _getArgs(
         parser.print_help()
         sys.exit(2)
 
-    not_found = 1
-    for first_rest, arg in enumerate(unparsed_args):  # .index() with exception is a crap.
-        if "--" == arg:
-            not_found = 0
-            break
+    try:
+        first_rest = unparsed_args.index("--") + 1
+    except ValueError:
+        first_rest = len(unparsed_args)
 
-    first_rest += 1 + not_found  # type: ignore
     if first_rest < len(unparsed_args):
         mode_args = unparsed_args[: first_rest - 1]
         unparsed_args = unparsed_args[first_rest:]
@@ -228,6 +230,9 @@ class BazelParser(BaseParser):
     # matches repo part in any external path spec. Not sure leading optional ./ is useful,
     # haven't seen it, but leaving it just in case
     r_any_external = re.compile(r"^(?:\.\/)?(?:bazel-[^\/]+\/[^\/]+\/bin\/)?external\/([^\/]+)\/")
+    r_external = re.compile(r"^(?:\.\/)?external\/")
+    # matches a whole external/... part in bazel-../../external/.. path spec
+    r_bazel_external = re.compile(r"^(?:\.\/)?bazel-[^\/]+\/[^\/]+\/bin\/(external\/.+)$")
 
     def __init__(self, Con: LoggingConsole, args: argparse.Namespace) -> None:
         Con.trace("Running base parser")
@@ -271,7 +276,7 @@ class BazelParser(BaseParser):
                     return None
 
         prev_path = fullpath
-        fullpath = os.path.realpath(fullpath)
+        fullpath = cachedRealPath(fullpath)
         if try_reject and prev_path != fullpath and f_reject_true(fullpath):
             self.Con.trace("_internalExpandPath: rejecting", fullpath)
             return None
@@ -308,7 +313,7 @@ class BazelParser(BaseParser):
 
         exists = False
         if self._test_files:
-            exists = os.path.exists(fullpath)  # there still might be symlinks, esp for dirs, so
+            exists = realPathExists(fullpath)  # there still might be symlinks, esp for dirs, so
             # can't really discriminate between files and dirs and others here.
             if not exists:
                 fullpath2 = None
@@ -321,7 +326,7 @@ class BazelParser(BaseParser):
                     ) is None:
                         return ret_rejected
 
-                    exists = os.path.exists(fullpath2)
+                    exists = realPathExists(fullpath2)
                     if exists:
                         fullpath = fullpath2
 
@@ -384,24 +389,27 @@ class BazelParser(BaseParser):
     def _update(self) -> None:
         ext_paths: dict[str, str] = {}  # external canonical_name -> realpath
         extinc_paths: dict[str, str] = {}  # external include paths
-        ext_ccs: dict[str, list[CompileCommand]] = {}
-        ext_cctimes: dict[str, list[float]] = {}
+        ext_ccs: defaultdict[str, list[CompileCommand]] = defaultdict(list)
+        ext_cctimes: defaultdict[str, array.array] = defaultdict(
+            functools.partial(array.array, "d")
+        )
         # TODO other commands!
 
         new_ccs: list[CompileCommand] = []  # new compile_commands for the project only
-        new_ccs_time: list[float] = []
+        new_ccs_time = array.array("d")
 
         notfound_inc: set[str] = set()
 
-        r_external = re.compile(r"^(?:\.\/)?external\/")
-        # matches a whole external/... part in bazel-../../external/.. path spec
-        r_bazel_external = re.compile(r"^(?:\.\/)?bazel-[^\/]+\/[^\/]+\/bin\/(external\/.+)$")
+        # binding often used methods to locals
+        match_any_external = self.r_any_external.match
+        match_external = self.r_external.match
+        match_bazel_external = self.r_bazel_external.match
 
         def _fixDirPath(orig_path: str, argidx: int, args: list[str] | None) -> str:
             """Expands a directory path handling bazel's quirks related to specifying about the
             same dir path under a different internal path. Returns an escaped path"""
             nonlocal extinc_paths, notfound_inc
-            m_ext = self.r_any_external.match(orig_path)
+            m_ext = match_any_external(orig_path)
             if m_ext:
                 r = m_ext.group(1)
                 if r not in extinc_paths:
@@ -409,14 +417,14 @@ class BazelParser(BaseParser):
                     assert repo_path is not None  # since no rejector func was supplied
                     extinc_paths[r] = repo_path
 
-            path, exists = self._expandPath(bool(r_external.match(orig_path)), "", orig_path, False)
+            path, exists = self._expandPath(bool(match_external(orig_path)), "", orig_path, False)
             assert path is not None
             if self._test_files and not exists:
                 err = True
                 if args is not None:
                     # ignoring existence test failure for same qualified args starting with bazel-out/k8-opt/bin/external/... dirs
                     # that exist as just normally qualified external/... args. This seems to be a bazel quirk
-                    m_bzl_ext = r_bazel_external.match(orig_path)
+                    m_bzl_ext = match_bazel_external(orig_path)
                     if m_bzl_ext:
                         ext = m_bzl_ext.group(1)
                         qual = args[argidx - 1]  # can't be negative
@@ -430,14 +438,15 @@ class BazelParser(BaseParser):
                     notfound_inc.add(orig_path)
             return path
 
-        with Progress(console=self.Con) as progress:  # transient=True,
+        import rich.progress  # lazy import, same as in common.py
+
+        with rich.progress.Progress(console=self.Con.console) as progress:  # transient=True,
             task = progress.add_task(
                 "Applying Bazel-specific transformations to the log...",
                 total=len(self.compile_commands),
             )
-            for ccidx, cc in enumerate(self.compile_commands):
-                cctime = self.compile_cmd_time[ccidx]
-                args, output, sources, line_num = cc
+            for cc, cctime in zip(self.compile_commands, self.compile_cmd_time):
+                args, output, sources, line_num = cc.args, cc.output, cc.sources, cc.line_num
 
                 assert bool(sources)  # expect it be not empty here
                 is_externals = [False] * len(sources)
@@ -448,7 +457,7 @@ class BazelParser(BaseParser):
                 for src_idx in range(len(sources)):
                     src = sources[src_idx]
                     # deciding if this is external
-                    m_external = self.r_any_external.match(src)
+                    m_external = match_any_external(src)
                     is_externals[src_idx] = bool(m_external)
                     if m_external:
                         repo = m_external.group(1)
@@ -468,7 +477,7 @@ class BazelParser(BaseParser):
 
                     # checking and updating the source path
                     path, _ = self._expandPath(
-                        bool(self.r_any_external.match(src)),
+                        is_externals[src_idx],
                         "",
                         src,
                         lambda: f"Log line #{line_num}.",
@@ -487,7 +496,7 @@ class BazelParser(BaseParser):
                         sources = None
                         break
 
-                    sources[src_idx] = path  # by convention, storeJson() does escapePath()
+                    sources[src_idx] = path  # by convention, sources are unescaped
 
                 if not sources:  # if discarded due to --discard_sources
                     continue
@@ -555,8 +564,8 @@ class BazelParser(BaseParser):
                             line_num,
                         )
                     assert isinstance(repo, str)
-                    ext_ccs.setdefault(repo, []).append(new_cc)
-                    ext_cctimes.setdefault(repo, []).append(cctime)
+                    ext_ccs[repo].append(new_cc)
+                    ext_cctimes[repo].append(cctime)
                 else:
                     if any(is_externals):
                         # this should never happen, but a sanity check is never redundant
@@ -571,6 +580,7 @@ class BazelParser(BaseParser):
                     new_ccs.append(new_cc)
                     new_ccs_time.append(cctime)
                 progress.advance(task)
+            self.Con.flush()  # buffered records must be rendered above the progress bar
 
         if self.Con.will_log(self.Con.LogLevel.Debug):
             self.Con.debug(
@@ -610,9 +620,11 @@ class BazelParser(BaseParser):
         self._new_cc = new_ccs
         self._new_cc_time = new_ccs_time
 
-        # merging processed list back into the base class list storage
+        # merging processed list back into the base class list storage. Only references are copied
         self.compile_commands = list(itertools.chain(new_ccs, *ext_ccs.values()))
-        self.compile_cmd_time = list(itertools.chain(new_ccs_time, *ext_cctimes.values()))
+        self.compile_cmd_time = array.array(
+            "d", itertools.chain(new_ccs_time, *ext_cctimes.values())
+        )
 
         # TODO other commands!
 
@@ -704,10 +716,8 @@ class BazelParser(BaseParser):
                 self.Con,
                 dest_dir,
                 True,
-                list(itertools.chain(self._new_cc, *(self._ext_ccs[r] for r in take_repos))),
-                list(
-                    itertools.chain(self._new_cc_time, *(self._ext_cctimes[r] for r in take_repos))
-                )
+                itertools.chain(self._new_cc, *(self._ext_ccs[r] for r in take_repos)),
+                itertools.chain(self._new_cc_time, *(self._ext_cctimes[r] for r in take_repos))
                 if save_duration
                 else None,
                 self._cwd,
@@ -905,6 +915,7 @@ class BazelWrap:
 
     def _handleClean(self, args: argparse.Namespace) -> None:
         if args.clean is None:
+            self.Con.flush()
             ans = input(
                 "\nATTENTION!\n\n'--clean' argument wasn't specified. To gather all build system "
                 "information, yacce has to supervise the complete build process therefore it's "